@@ -4,15 +4,47 @@ import mediapipe as mp
 import numpy as np
 import pygame
 import os
+import sys
 from dataclasses import dataclass
-from typing import Dict, Tuple, List
+from typing import Tuple
 import time
+import threading
+import queue
+import weakref
 from enum import Enum
 
-pygame.mixer.init(44100, -16, 2, 64)
+pygame.mixer.init(44100, -16, 2, 512)
 pygame.mixer.set_num_channels(16)
 
 
+def _audio_worker(triggers: queue.SimpleQueue):
+    while True:
+        channel, sound = triggers.get()
+        try:
+            channel.play(sound)
+        except Exception as e:
+            print(f"Warning: Failed to play sound: {e}")
+
+
+@st.cache_resource
+def get_audio_queue() -> queue.SimpleQueue:
+    triggers = queue.SimpleQueue()
+    threading.Thread(target=_audio_worker, args=(triggers,), daemon=True).start()
+    return triggers
+
+
+_FONT = cv2.FONT_HERSHEY_SIMPLEX
+_WHITE = (255, 255, 255)
+_GRAY = (128, 128, 128)
+_GREEN = (0, 255, 0)
+_YELLOW = (0, 255, 255)
+
+CAPTURE_SIZE = (320, 240)
+CAPTURE_FPS = 60
+PREVIEW_SIZE = (480, 360)
+PREVIEW_JPEG_QUALITY = 70
+
+
 class Mode(Enum):
     TRAINING = "Training"
     PRACTICE = "Practice"
@@ -21,21 +53,39 @@ class Mode(Enum):
     CUSTOM = "Custom"
 
 
-@dataclass
+@dataclass(slots=True)
 class FingerSound:
     name: str
     sound_file: str
     sound: pygame.mixer.Sound = None
-    last_trigger_time: float = 0.0
-    cooldown: float = 0.15
-    last_positions: List[float] = None
-    is_moving_down: bool = False
+    channel: pygame.mixer.Channel = None
     volume: float = 0.7
     is_active: bool = True
     skill_level: int = 1
 
-    def __post_init__(self):
-        self.last_positions = []
+
+def detect_triggers(
+    pos_history: np.ndarray,
+    positions: np.ndarray,
+    last_trigger: np.ndarray,
+    cooldown: np.ndarray,
+    moving_down: np.ndarray,
+    enabled: np.ndarray,
+    down_threshold: float,
+    up_threshold: float,
+    now: float,
+) -> Tuple[np.ndarray, np.ndarray]:
+    pos_history[:, :-1] = pos_history[:, 1:]
+    pos_history[:, -1] = positions
+    avg_motion = (pos_history[:, -1] - pos_history[:, 0]) / (pos_history.shape[1] - 1)
+    down = avg_motion > down_threshold
+    up = avg_motion < -up_threshold
+
+    triggers = down & ~moving_down & enabled & (now - last_trigger >= cooldown)
+    last_trigger[triggers] = now
+    moving_down |= down
+    moving_down &= ~up
+    return triggers, avg_motion
 
 
 class VirtualDrumkit:
@@ -47,11 +97,12 @@ class VirtualDrumkit:
             min_detection_confidence=0.7,
             min_tracking_confidence=0.7,
         )
+        weakref.finalize(self, self.hands.close)
         self.mp_draw = mp.solutions.drawing_utils
 
         self.current_mode = Mode.TRAINING
         self.skill_level = 1
-        self.last_hand_trigger_time = {"LEFT": 0.0, "RIGHT": 0.0}
+        self.last_hand_trigger_time = {"LEFT": float("-inf"), "RIGHT": float("-inf")}
         self.hand_cooldown = 0.1
 
         self.finger_sounds = {
@@ -111,7 +162,9 @@ class VirtualDrumkit:
 
         self.update_mode_parameters()
 
-        for sound in self.finger_sounds.values():
+        pygame.mixer.set_reserved(len(self.finger_sounds))
+        for i, sound in enumerate(self.finger_sounds.values()):
+            sound.channel = pygame.mixer.Channel(i)
             if os.path.exists(sound.sound_file):
                 sound.sound = pygame.mixer.Sound(sound.sound_file)
                 if "Kick" in sound.name:
@@ -129,10 +182,40 @@ class VirtualDrumkit:
             "RING": 16,
             "PINKY": 20,
         }
+        self._finger_order = [
+            (hand_side, finger_name)
+            for hand_side in ("RIGHT", "LEFT")
+            for finger_name in self.finger_indices
+        ]
+        self._pos_history = np.full(
+            (len(self._finger_order), self.history_size), np.nan, dtype=np.float32
+        )
+        self._sounds = tuple(
+            self.finger_sounds.get(f"{hand_side}_{finger_name}")
+            for hand_side, finger_name in self._finger_order
+        )
+        self._landmark_ids = (0,) + tuple(self.finger_indices.values())
+        self.cooldowns = np.full(len(self._sounds), 0.15)
+        self._last_trigger = np.full(len(self._sounds), -np.inf)
+        self._moving_down = np.zeros(len(self._sounds), dtype=bool)
+        self._avg_motion = np.full(len(self._sounds), np.nan, dtype=np.float32)
+        self._audio_queue = get_audio_queue()
 
         self.pattern_history = []
         self.pattern_window = 2.0
 
+        self.detection_size = 256
+        self._frame_i = 0
+        self._last_results = None
+        self._small_buf = None
+        self._rgb_buf = None
+        self.idle_size = (80, 60)
+        self.idle_threshold = 10
+        self._prev_gray = None
+        self._legend_cache = None
+        self._legend_mask = None
+        self._legend_signature = None
+
     def update_mode_parameters(self):
         if self.current_mode in self.mode_parameters:
             params = self.mode_parameters[self.current_mode]
@@ -140,66 +223,61 @@ class VirtualDrumkit:
             self.up_threshold = params["up_threshold"]
             self.hand_cooldown = params["hand_cooldown"]
 
-    def detect_downward_motion(self, positions: List[float]) -> bool:
-        if len(positions) < 2:
-            return False
-        motions = [positions[i] - positions[i - 1] for i in range(1, len(positions))]
-        avg_motion = sum(motions) / len(motions)
-        return avg_motion > self.down_threshold
-
-    def detect_upward_motion(self, positions: List[float]) -> bool:
-        if len(positions) < 2:
-            return False
-        motions = [positions[i] - positions[i - 1] for i in range(1, len(positions))]
-        avg_motion = sum(motions) / len(motions)
-        return avg_motion < -self.up_threshold
-
-    def can_trigger_sound(
-        self, hand_side: str, sound: FingerSound, current_time: float
-    ) -> bool:
-        if sound.skill_level > self.skill_level:
-            return False
-
-        if current_time - sound.last_trigger_time < sound.cooldown:
-            return False
-
-        return True
-
-    def process_frame(self, frame):
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = self.hands.process(frame_rgb)
-
+    def is_idle_frame(self, frame) -> bool:
+        thumb = cv2.resize(frame, self.idle_size, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(thumb, cv2.COLOR_BGR2GRAY)
+        if (
+            self._prev_gray is not None
+            and cv2.absdiff(gray, self._prev_gray).max() < self.idle_threshold
+        ):
+            return True
+        self._prev_gray = gray
+        return False
+
+    def detect_hands(self, frame):
         h, w, _ = frame.shape
-        current_time = time.time()
+        scale = self.detection_size / max(h, w)
+        self._small_buf = cv2.resize(
+            frame,
+            (int(w * scale), int(h * scale)),
+            dst=self._small_buf,
+            interpolation=cv2.INTER_AREA,
+        )
+        self._rgb_buf = cv2.cvtColor(
+            self._small_buf, cv2.COLOR_BGR2RGB, dst=self._rgb_buf
+        )
+        return self.hands.process(self._rgb_buf)
 
+    def render_legend(self):
+        legend = np.zeros((300, 260, 3), dtype=np.uint8)
         cv2.putText(
-            frame,
+            legend,
             f"Mode: {self.current_mode.value}",
             (10, 30),
-            cv2.FONT_HERSHEY_SIMPLEX,
+            _FONT,
             0.7,
-            (255, 255, 255),
+            _WHITE,
             2,
         )
         cv2.putText(
-            frame,
+            legend,
             f"Level: {self.skill_level}",
             (10, 60),
-            cv2.FONT_HERSHEY_SIMPLEX,
+            _FONT,
             0.7,
-            (255, 255, 255),
+            _WHITE,
             2,
         )
 
         legend_y = 90
         for hand_side in ["RIGHT", "LEFT"]:
             cv2.putText(
-                frame,
+                legend,
                 f"{hand_side} Hand:",
                 (10, legend_y),
-                cv2.FONT_HERSHEY_SIMPLEX,
+                _FONT,
                 0.5,
-                (255, 255, 255),
+                _WHITE,
                 1,
             )
             legend_y += 20
@@ -209,77 +287,171 @@ class VirtualDrumkit:
                 if finger_key in self.finger_sounds:
                     sound = self.finger_sounds[finger_key]
                     if sound.skill_level <= self.skill_level:
-                        color = (255, 255, 255) if sound.is_active else (128, 128, 128)
+                        color = _WHITE if sound.is_active else _GRAY
                         cv2.putText(
-                            frame,
+                            legend,
                             f"{finger}: {sound.name}",
                             (20, legend_y),
-                            cv2.FONT_HERSHEY_SIMPLEX,
+                            _FONT,
                             0.4,
                             color,
                             1,
                         )
                         legend_y += 15
 
-        if results.multi_hand_landmarks:
-            for hand_idx, hand_landmarks in enumerate(results.multi_hand_landmarks):
-                hand_side = "LEFT" if hand_idx == 0 else "RIGHT"
-                wrist_y = hand_landmarks.landmark[0].y
-
-                for finger_name, tip_idx in self.finger_indices.items():
-                    finger_key = f"{hand_side}_{finger_name}"
-                    if finger_key in self.finger_sounds:
-                        sound = self.finger_sounds[finger_key]
+        legend = legend[: legend_y + 5]
+        return legend, legend.any(axis=2)
 
-                        if sound.skill_level > self.skill_level:
-                            continue
-
-                        tip = hand_landmarks.landmark[tip_idx]
-                        relative_y = tip.y - wrist_y
-                        tip_pos = (int(tip.x * w), int(tip.y * h))
+    def draw_legend(self, frame):
+        signature = (
+            self.current_mode,
+            self.skill_level,
+            tuple(s.is_active for s in self.finger_sounds.values()),
+        )
+        if signature != self._legend_signature:
+            self._legend_cache, self._legend_mask = self.render_legend()
+            self._legend_signature = signature
+
+        h = min(self._legend_cache.shape[0], frame.shape[0])
+        w = min(self._legend_cache.shape[1], frame.shape[1])
+        np.copyto(
+            frame[:h, :w],
+            self._legend_cache[:h, :w],
+            where=self._legend_mask[:h, :w, None],
+        )
 
-                        sound.last_positions.append(relative_y)
-                        if len(sound.last_positions) > self.history_size:
-                            sound.last_positions.pop(0)
+    def process_frame(self, frame, canvas=None):
+        if canvas is None:
+            canvas = frame
+        fresh = self._frame_i % 2 == 0 or self._last_results is None
+        self._frame_i += 1
+        if fresh and (self._last_results is None or not self.is_idle_frame(frame)):
+            self._last_results = self.detect_hands(frame)
+        results = self._last_results
+
+        h, w, _ = canvas.shape
+        current_time = time.monotonic()
+        skill_level = self.skill_level
+        down_threshold = self.down_threshold
+        up_threshold = self.up_threshold
+        fingers_per_hand = len(self.finger_indices)
+        sounds = self._sounds
+        landmark_ids = self._landmark_ids
+        moving_down = self._moving_down
+
+        self.draw_legend(canvas)
+
+        positions = np.full(len(self._finger_order), np.nan, dtype=np.float32)
+        enabled = np.zeros(len(self._finger_order), dtype=bool)
+        visible = []
+        if results.multi_hand_landmarks:
+            for hand_idx, hand_landmarks in enumerate(results.multi_hand_landmarks):
+                hand_bit = 1 if hand_idx == 0 else 0
+                start = hand_bit * fingers_per_hand
+                lm = hand_landmarks.landmark
+                points = [(lm[i].x, lm[i].y) for i in landmark_ids]
+                wrist_y = points[0][1]
+
+                for k in range(start, start + fingers_per_hand):
+                    sound = sounds[k]
+                    if sound is None or sound.skill_level > skill_level:
+                        continue
+                    tip_x, tip_y = points[1 + k - start]
+                    positions[k] = tip_y - wrist_y
+                    enabled[k] = sound.sound is not None and sound.is_active
+                    visible.append((k, sound, (int(tip_x * w), int(tip_y * h))))
+
+        if fresh:
+            triggers, self._avg_motion = detect_triggers(
+                self._pos_history,
+                positions,
+                self._last_trigger,
+                self.cooldowns,
+                moving_down,
+                enabled,
+                down_threshold,
+                up_threshold,
+                current_time,
+            )
+            for k in np.flatnonzero(triggers):
+                sound = sounds[k]
+                self._audio_queue.put_nowait((sound.channel, sound.sound))
+        avg_motion = self._avg_motion
+        marker_threshold = up_threshold * 0.5
+
+        for k, sound, tip_pos in visible:
+            if not (moving_down[k] or abs(avg_motion[k]) > marker_threshold):
+                continue
+
+            base_color = _GREEN if moving_down[k] else _YELLOW
+            color = base_color if sound.is_active else _GRAY
+            cv2.circle(canvas, tip_pos, 8, color, -1)
+            cv2.putText(
+                canvas,
+                sound.name,
+                (tip_pos[0] + 10, tip_pos[1]),
+                _FONT,
+                0.4,
+                color,
+                1,
+                cv2.LINE_4,
+            )
 
-                        is_moving_down = self.detect_downward_motion(
-                            sound.last_positions
-                        )
-                        is_moving_up = self.detect_upward_motion(sound.last_positions)
-
-                        if is_moving_down and not sound.is_moving_down:
-                            if self.can_trigger_sound(hand_side, sound, current_time):
-                                if sound.sound and sound.is_active:
-                                    sound.sound.play()
-                                    sound.last_trigger_time = current_time
-                                    print(f"Triggered {sound.name}")
-                            sound.is_moving_down = True
-                        elif is_moving_up:
-                            sound.is_moving_down = False
-
-                        if sound.skill_level <= self.skill_level:
-                            base_color = (
-                                (0, 255, 0) if sound.is_moving_down else (0, 255, 255)
-                            )
-                            color = base_color if sound.is_active else (128, 128, 128)
-                            cv2.circle(frame, tip_pos, 8, color, -1)
-                            cv2.putText(
-                                frame,
-                                sound.name,
-                                (tip_pos[0] + 10, tip_pos[1]),
-                                cv2.FONT_HERSHEY_SIMPLEX,
-                                0.4,
-                                color,
-                                1,
-                            )
-
-        return frame
+        return canvas
+
+
+class CaptureThread:
+    def __init__(self, source=0):
+        self.cap = cv2.VideoCapture(source)
+        if sys.platform.startswith("linux"):
+            self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*"MJPG"))
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, CAPTURE_SIZE[0])
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, CAPTURE_SIZE[1])
+        self.cap.set(cv2.CAP_PROP_FPS, CAPTURE_FPS)
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self._cond = threading.Condition()
+        self._frame = None
+        self._ret = True
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while self._running:
+            ret, frame = self.cap.read()
+            with self._cond:
+                self._ret = ret
+                self._frame = frame if ret else None
+                self._cond.notify()
+            if not ret:
+                break
+
+    def is_opened(self) -> bool:
+        return self.cap.isOpened()
+
+    def latest(self):
+        with self._cond:
+            while self._frame is None and self._ret and self._thread.is_alive():
+                self._cond.wait(0.5)
+            frame, self._frame = self._frame, None
+            return frame
+
+    def release(self):
+        self._running = False
+        self._thread.join()
+        self.cap.release()
+
+
+def get_drumkit() -> VirtualDrumkit:
+    if "drumkit" not in st.session_state:
+        st.session_state.drumkit = VirtualDrumkit()
+    return st.session_state.drumkit
 
 
 def main():
     st.title("TR-808 Finger Drummer")
 
-    drumkit = VirtualDrumkit()
+    drumkit = get_drumkit()
 
     with st.sidebar:
         st.header("Controls")
@@ -310,24 +482,35 @@ def main():
     st.write(f"Skill Level: {drumkit.skill_level}")
     st.write("Move your fingers down to play sounds!")
 
-    cap = cv2.VideoCapture(0)
+    capture = CaptureThread(0)
 
     frame_placeholder = st.empty()
 
     stop_button = st.button("Stop")
 
-    while cap.isOpened() and not stop_button:
-        ret, frame = cap.read()
-        if not ret:
-            st.error("Failed to read from webcam")
-            break
-
-        frame = cv2.flip(frame, 1)
-        processed_frame = drumkit.process_frame(frame)
-        rgb_frame = cv2.cvtColor(processed_frame, cv2.COLOR_BGR2RGB)
-        frame_placeholder.image(rgb_frame, channels="RGB")
-
-    cap.release()
+    flipped = None
+    preview = None
+    try:
+        while capture.is_opened() and not stop_button:
+            frame = capture.latest()
+            if frame is None:
+                st.error("Failed to read from webcam")
+                break
+
+            flipped = cv2.flip(frame, 1, dst=flipped)
+            preview = cv2.resize(
+                flipped, PREVIEW_SIZE, dst=preview, interpolation=cv2.INTER_LINEAR
+            )
+            processed_frame = drumkit.process_frame(flipped, preview)
+            ok, jpeg = cv2.imencode(
+                ".jpg",
+                processed_frame,
+                [cv2.IMWRITE_JPEG_QUALITY, PREVIEW_JPEG_QUALITY],
+            )
+            if ok:
+                frame_placeholder.image(jpeg.tobytes())
+    finally:
+        capture.release()
 
 
 if __name__ == "__main__":